@@ -0,0 +1,246 @@
+"""
+Benchmarks for Flask-MongoRest-Swagger.
+
+Builds a synthetic schema (mongoengine documents and Flask-MongoRest
+resources; no database needed), then times registering it, building the
+models, and serving the documentation through the Flask test client.
+
+Usage:
+```
+python benchmarks/bench_swagger.py --resources 200 --output results.json
+```
+
+Compare two runs with `--compare old.json new.json`.
+"""
+from __future__ import print_function
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+try:
+    import resource as rusage
+except ImportError:  # not on Unix
+    rusage = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from flask import Flask  # noqa
+from flask.ext.mongorest import MongoRest, methods, operators  # noqa
+from flask.ext.mongorest.resources import Resource  # noqa
+from flask.ext.mongorest.views import ResourceView  # noqa
+from mongoengine import Document, EmbeddedDocument, fields  # noqa
+
+from flask_mongorest_swagger import Swagger, SwaggerMiddleware, Model  # noqa
+
+
+FIELD_TYPES = [
+    lambda: fields.StringField(max_length=200, help_text='A string'),
+    lambda: fields.IntField(help_text='An integer'),
+    lambda: fields.FloatField(help_text='A float'),
+    lambda: fields.BooleanField(help_text='A boolean'),
+    lambda: fields.DateTimeField(help_text='A date'),
+    lambda: fields.EmailField(help_text='An e-mail address'),
+    lambda: fields.ListField(fields.StringField(), help_text='Strings')]
+FILTER_OPERATORS = [operators.Exact, operators.Startswith, operators.In,
+                    operators.Gt, operators.Lt]
+
+
+def make_fields(count):
+    return dict(('field%d' % i, FIELD_TYPES[i % len(FIELD_TYPES)]())
+                for i in range(count))
+
+
+def make_schema(options):
+    """
+    Returns a list of `(resource, view)` classes for a synthetic schema.
+    """
+    embedded = []
+    for i in range(options.embedded):
+        embedded.append(type('BenchEmbedded%d' % i, (EmbeddedDocument,),
+                             make_fields(options.fields)))
+    views = []
+    resources = []
+    for i in range(options.resources):
+        attrs = make_fields(options.fields)
+        for j, document in enumerate(embedded):
+            attrs['embedded%d' % j] = fields.EmbeddedDocumentField(document)
+        related = resources[-options.related:] if options.related else []
+        for j, related_resource in enumerate(related):
+            attrs['related%d' % j] = fields.ReferenceField(
+                related_resource.document)
+        # before creating the document: its metaclass adds to `attrs`
+        filter_names = sorted(attrs)[:options.filters]
+        document = type('BenchDocument%d' % i, (Document,), attrs)
+
+        resource = type('BenchResource%d' % i, (Resource,), {
+            'document': document,
+            'filters': dict((name, FILTER_OPERATORS)
+                            for name in filter_names),
+            'related_resources': dict(('related%d' % j, related_resource)
+                                      for (j, related_resource)
+                                      in enumerate(related))})
+        resources.append(resource)
+        views.append(type('BenchView%d' % i, (ResourceView,), {
+            'resource': resource,
+            'methods': [methods.List, methods.Create, methods.BulkUpdate,
+                        methods.Fetch, methods.Update, methods.Delete]}))
+    return views
+
+
+def peak_memory():
+    """
+    Peak resident memory of the process so far, in KB (Unix only).
+    """
+    if rusage is None:
+        return None
+    peak = rusage.getrusage(rusage.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':  # bytes, not KB
+        peak //= 1024
+    return peak
+
+
+def percentile(samples, percent):
+    samples = sorted(samples)
+    index = int(round((len(samples) - 1) * percent / 100.0))
+    return samples[index]
+
+
+def summarize(samples):
+    """
+    Latency percentiles (in ms) and throughput (per second) for a list of
+    timings in seconds.
+    """
+    total = sum(samples)
+    return {
+        'count': len(samples),
+        'mean_ms': total / len(samples) * 1000,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p90_ms': percentile(samples, 90) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'max_ms': max(samples) * 1000,
+        'per_second': len(samples) / total if total else None}
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        samples.append(time.time() - start)
+    return samples
+
+
+def make_app(views, **swagger_kwargs):
+    app = Flask(__name__)
+    mongorest = MongoRest(app)
+    swagger = Swagger(mongorest, **swagger_kwargs)
+    for view in views:
+        swagger.register(view, url='/%s/' % view.__name__.lower())
+    return app, swagger
+
+
+def run(options):
+    views = make_schema(options)
+    results = {}
+
+    gc.collect()
+    start = time.time()
+    app, swagger = make_app(views)
+    results['register'] = {'seconds': time.time() - start,
+                           'views': len(views)}
+
+    start = time.time()
+    swagger.build()
+    results['build'] = {'seconds': time.time() - start}
+    results['memory_report'] = swagger.memory_report()
+
+    results['model_from_resource'] = summarize(timed(
+        lambda: [Model.from_resource(view.resource) for view in views],
+        options.repeat))
+
+    client = app.test_client()
+    index = '%s/%s.json' % (swagger.url_prefix, swagger.document_name)
+    names = list(swagger._apis)
+    declarations = ['%s/%s.json/%s' % (swagger.url_prefix,
+                                       swagger.document_name, name)
+                    for name in names]
+    results['api_docs'] = summarize(timed(lambda: client.get(index),
+                                          options.requests))
+    requests = itertools.cycle(declarations)
+    results['api_declaration'] = summarize(timed(
+        lambda: client.get(next(requests)), options.requests))
+    results['api_declaration_gzip'] = summarize(timed(
+        lambda: client.get(next(requests),
+                           headers={'Accept-Encoding': 'gzip'}),
+        options.requests))
+
+    # the same requests again, answered by the middleware from the (now
+    # warm) render cache
+    app.wsgi_app = SwaggerMiddleware(swagger, app.wsgi_app)
+    results['middleware_api_docs'] = summarize(timed(
+        lambda: client.get(index), options.requests))
+    results['middleware_api_declaration'] = summarize(timed(
+        lambda: client.get(next(requests)), options.requests))
+    results['peak_memory_kb'] = peak_memory()
+    return results
+
+
+def compare(old_path, new_path):
+    """
+    Prints the change in each timing between two saved runs.
+    """
+    with open(old_path) as f:
+        old = json.load(f)['results']
+    with open(new_path) as f:
+        new = json.load(f)['results']
+    for name in sorted(set(old) & set(new)):
+        for key in sorted(set(old[name]) & set(new[name])):
+            if not (key.endswith('_ms') or key == 'seconds'):
+                continue
+            before, after = old[name][key], new[name][key]
+            change = (after - before) / before * 100 if before else 0
+            print('%-28s %-8s %10.3f -> %10.3f (%+.1f%%)' % (
+                name, key, before, after, change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        '\n')[0])
+    parser.add_argument('--resources', type=int, default=100)
+    parser.add_argument('--fields', type=int, default=20)
+    parser.add_argument('--filters', type=int, default=5)
+    parser.add_argument('--embedded', type=int, default=2)
+    parser.add_argument('--related', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=1000,
+                        help='requests per route')
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='repetitions of the in-process timings')
+    parser.add_argument('--output', help='write the results as JSON here')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two saved runs instead')
+    options = parser.parse_args(argv)
+    if options.compare:
+        compare(*options.compare)
+        return
+
+    results = run(options)
+    data = {
+        'python': platform.python_version(),
+        'options': dict((key, value)
+                        for (key, value) in vars(options).items()
+                        if key not in ('output', 'compare')),
+        'results': results}
+    output = json.dumps(data, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
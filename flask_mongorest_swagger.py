@@ -49,22 +49,64 @@ This generates a Swagger API available at
 
 Author: Paul Swartz <pswartz@matchbox.net>
 """
-from flask import jsonify as _jsonify, request, abort, Blueprint, url_for
+from flask import request, abort, Blueprint, Response
 from flask.ext.mongorest import methods
 from mongoengine import fields
+from werkzeug.http import (http_date, is_resource_modified,
+                           parse_accept_header, quote_etag)
+from werkzeug.urls import url_quote
+from werkzeug.wsgi import get_host
 try:
     from collections import OrderedDict
 except ImportError:
     from ordereddict import OrderedDict  # noqa
+from datetime import datetime
+from inspect import getmro
+from multiprocessing.pool import ThreadPool
 from operator import itemgetter
+import argparse
+import errno
+import hashlib
+import json
+import keyword
+import logging
+import math
+import os
+import posixpath
 import re
+import sys
+import tempfile
+import threading
+import time
+import zlib
+try:
+    from urlparse import urlsplit
+except ImportError:
+    from urllib.parse import urlsplit  # noqa
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 
+logger = logging.getLogger(__name__)
+
 VIEW_ARGS = re.compile(r'[{]([^{}]+)[}]')
 LIST_METHODS = [methods.List, methods.Create, methods.BulkUpdate]
 DETAIL_METHODS = [methods.Update, methods.Fetch, methods.Delete]
 
 
+# the Flask-MongoRest method handling a request, by (HTTP method, whether
+# there's an ID in the URL)
+REQUEST_METHODS = {
+    ('get', False): methods.List,
+    ('post', False): methods.Create,
+    ('put', False): methods.BulkUpdate,
+    ('get', True): methods.Fetch,
+    ('put', True): methods.Update,
+    ('delete', True): methods.Delete}
+
+
 DEFAULT_METHOD_SUMMARY = {
     methods.List: 'List all %ss',
     methods.Create: 'Create a new %s',
@@ -82,14 +124,159 @@ FIELD_TO_TYPE = {
     fields.BooleanField: 'boolean',
     fields.DateTimeField: 'Date',
     fields.ObjectIdField: 'string'}
+_FIELD_TYPES = {}
 
 
-def jsonify(data):
-    response = _jsonify(data)
+def gzip_compress(data):
+    # wbits=31 writes a gzip header with a zero mtime, so the output only
+    # depends on the input
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+# the formats documentation is served in
+FORMATS = ('json',)
+
+# filter operators MongoDB can't answer from an index, even on an indexed
+# field: negations, and regexes other than case-sensitive prefixes
+UNINDEXED_OPERATORS = frozenset([
+    'ne', 'nin', 'not', 'iexact', 'contains', 'icontains', 'istartswith',
+    'endswith', 'iendswith'])
+
+# filter operators a hashed index can answer: equality matches only
+HASHED_OPERATORS = frozenset(['', 'exact', 'in'])
+
+# query string arguments selecting part of a declaration (see select_api())
+SELECTION_ARGS = ('path', 'method', 'nickname', 'model')
+
+# bump when the generated documentation changes, so Swagger(cache_dir=...)
+# doesn't load files written by an older version
+CACHE_FORMAT = 3
+
+# Content-Encodings we pre-compress renderings with, in order of preference
+CODECS = OrderedDict()
+if brotli is not None:
+    CODECS['br'] = brotli.compress
+CODECS['gzip'] = gzip_compress
+# file extensions for the pre-compressed copies written by Swagger.export()
+CODEC_EXTENSIONS = {'br': '.br', 'gzip': '.gz'}
+
+
+def makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+# sorted like Flask's jsonify, so the bytes (and so the ETags) only depend on
+# the data, not on the order of the dicts
+ENCODER = json.JSONEncoder(indent=2, sort_keys=True)
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def dumps(data):
+    """
+    Serializes `data` the way all of the Swagger routes do.
+    """
+    return ENCODER.encode(data)
+
+
+def iterdumps(data, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Serializes `data` incrementally, yielding chunks of about `chunk_size`
+    bytes.  Joined together, they're the same as `dumps(data)`.
+    """
+    chunks = []
+    size = 0
+    for chunk in ENCODER.iterencode(data):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= chunk_size:
+            yield ''.join(chunks)
+            chunks = []
+            size = 0
+    if chunks:
+        yield ''.join(chunks)
+
+
+def json_response(body):
+    """
+    Wraps already-serialized JSON in a `Response`.
+    """
+    response = Response(body, mimetype='application/json')
     response.headers['Access-Control-Allow-Origin'] = '*'
     return response
 
 
+def jsonify(data):
+    return json_response(dumps(data))
+
+
+class Rendering(object):
+    """
+    A serialized response body, along with the ETag which identifies it and
+    a copy compressed with each of the available `CODECS`.
+    """
+    __slots__ = ('body', 'etag', 'encoded', 'last_modified')
+
+    def __init__(self, body, encoded=None, last_modified=None):
+        self.body = body
+        self.etag = hashlib.md5(body).hexdigest()
+        if encoded is None:
+            encoded = OrderedDict(
+                (encoding, compress(body))
+                for (encoding, compress) in CODECS.iteritems())
+        self.encoded = encoded
+        self.last_modified = last_modified
+
+    @classmethod
+    def from_file(klass, path):
+        """
+        Loads a rendering written by `write()`, along with whichever
+        pre-compressed copies are next to it.
+        """
+        with open(path, 'rb') as f:
+            body = f.read()
+        encoded = OrderedDict()
+        for encoding in CODECS:
+            try:
+                with open(path + CODEC_EXTENSIONS[encoding], 'rb') as f:
+                    encoded[encoding] = f.read()
+            except IOError:
+                pass
+        last_modified = datetime.utcfromtimestamp(
+            int(os.path.getmtime(path)))
+        return klass(body, encoded, last_modified)
+
+    def write(self, path, compress=False):
+        """
+        Writes the body to `path`, and with `compress` the pre-compressed
+        copies next to it.
+        """
+        makedirs(os.path.dirname(path))
+        files = [(path, self.body)]
+        if compress:
+            files.extend((path + CODEC_EXTENSIONS[encoding], data)
+                         for (encoding, data) in self.encoded.iteritems())
+        for filename, data in files:
+            with open(filename, 'wb') as f:
+                f.write(data)
+
+    def negotiate(self, accept_encodings):
+        """
+        Returns the `(content_encoding, body, etag)` to send to a client
+        with the given `Accept-Encoding`.  `content_encoding` is None for
+        the uncompressed body.
+        """
+        encoding = accept_encodings.best_match(list(self.encoded))
+        if encoding is None:
+            return None, self.body, self.etag
+        return (encoding, self.encoded[encoding],
+                '%s-%s' % (self.etag, encoding))
+
+
 def all_values(_name, obj, *args, **kwargs):
     value = getattr(obj, _name, None)
     if value:
@@ -114,6 +301,221 @@ def first_value(_name, obj, *args, **kwargs):
     return v
 
 
+def field_type(field_class):
+    """
+    Returns the primitive Swagger type for `field_class`, or None.  Looks
+    through the MRO so that subclasses of the fields in `FIELD_TO_TYPE`
+    (EmailField, URLField, ...) are covered too.  Results are cached per
+    field class.
+    """
+    try:
+        return _FIELD_TYPES[field_class]
+    except KeyError:
+        pass
+    type_ = None
+    for klass in getmro(field_class):
+        if klass in FIELD_TO_TYPE:
+            type_ = FIELD_TO_TYPE[klass]
+            break
+    _FIELD_TYPES[field_class] = type_
+    return type_
+
+
+# Swagger 1.1 primitive types, as Swagger 2.0 schemas
+SWAGGER2_TYPES = {
+    'string': {'type': 'string'},
+    'int': {'type': 'integer', 'format': 'int32'},
+    'float': {'type': 'number', 'format': 'float'},
+    'boolean': {'type': 'boolean'},
+    'Date': {'type': 'string', 'format': 'date-time'}}
+LIST_TYPE = re.compile(r'^List\[(.+)\]$')
+# characters which would need escaping in a definition's JSON pointer
+DEFINITION_CHARS = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def swagger2_schema(type_, subtype=None, models=()):
+    """
+    Converts a Swagger 1.1 type name (optionally with the type of its
+    items) into a Swagger 2.0 schema.  `models` maps model ids to their
+    names in the definitions; those become `$ref`s.
+    """
+    list_type = LIST_TYPE.match(type_)
+    if list_type:
+        type_, subtype = 'List', list_type.group(1)
+    if type_ == 'List':
+        return {'type': 'array',
+                'items': swagger2_schema(subtype or 'string', models=models)}
+    if type_ == 'Object':
+        schema = {'type': 'object'}
+        if subtype:
+            schema['additionalProperties'] = swagger2_schema(
+                subtype, models=models)
+        return schema
+    if type_ in models:
+        return {'$ref': '#/definitions/%s' % models[type_]}
+    # anything else isn't known to be a string
+    return dict(SWAGGER2_TYPES.get(type_, {'type': 'object'}))
+
+
+def swagger2_extensions(data, converted):
+    """
+    Copies the vendor extensions (`x-` keys) from `data` into `converted`.
+    """
+    for key, value in data.iteritems():
+        if key.startswith('x-'):
+            converted[key] = value
+    return converted
+
+
+def swagger2_parameter(parameter, models=()):
+    converted = {'name': parameter['name'],
+                 'in': parameter['paramType'],
+                 'description': parameter.get('description', ''),
+                 'required': parameter.get('required', False)}
+    if parameter['paramType'] == 'body':
+        converted['schema'] = swagger2_schema(parameter['dataType'],
+                                              models=models)
+        return swagger2_extensions(parameter, converted)
+    # only primitives are allowed outside of the body
+    schema = swagger2_schema(parameter['dataType'])
+    allowable = parameter.get('allowableValues') or {}
+    if allowable.get('valueType') == 'VALUES':
+        schema['enum'] = allowable['values']
+    elif allowable.get('valueType') == 'RANGE':
+        schema['minimum'] = allowable['min']
+        schema['maximum'] = allowable['max']
+    if parameter.get('multiple'):
+        converted.update(type='array', items=schema, collectionFormat='csv')
+    else:
+        converted.update(schema)
+    return swagger2_extensions(parameter, converted)
+
+
+def swagger2_operation(operation, tag, models=()):
+    responses = {}
+    response_class = operation.get('responseClass')
+    if response_class:
+        responses['200'] = {
+            'description': 'Success',
+            'schema': swagger2_schema(response_class, models=models)}
+    else:
+        responses['200'] = {'description': 'Success'}
+    for error in operation.get('errorResponses', ()):
+        responses[str(error['code'])] = {'description': error['reason']}
+    converted = {
+        'operationId': operation['nickname'],
+        'summary': operation.get('summary') or '',
+        'description': operation.get('notes') or '',
+        'tags': [tag],
+        'parameters': [swagger2_parameter(parameter, models)
+                       for parameter in operation.get('parameters', ())],
+        'responses': responses}
+    return swagger2_extensions(operation, converted)
+
+
+def swagger2_model(model, models=()):
+    properties = {}
+    for name, prop in model['properties'].iteritems():
+        subtype = prop.get('items', {}).get('$ref')
+        schema = swagger2_schema(prop['type'], subtype, models)
+        if prop.get('description'):
+            schema['description'] = prop['description']
+        properties[name] = swagger2_extensions(prop, schema)
+    return swagger2_extensions(model, {'type': 'object',
+                                       'properties': properties})
+
+
+# rough sizes (in bytes, serialized to JSON) used to estimate how big
+# responses are; strings use their max_length, up to 'long_string'
+SIZE_ESTIMATES = {
+    'string': 32,
+    'long_string': 128,
+    'id': 26,
+    'int': 6,
+    'float': 10,
+    'boolean': 5,
+    'Date': 28,
+    'unknown': 16,
+    'list_items': 5,  # entries assumed in lists and dicts
+    'dict_key': 12,
+    'page_envelope': 32}  # {"data": [...], "has_more": ...}
+# how many levels of related resources the estimates render inline.
+# Flask-MongoRest serializes related resources recursively, but how deep
+# that goes depends on which references are set, so past this they're
+# counted as references
+RELATED_DEPTH = 2
+
+
+def estimate_size(field, _parents=()):
+    """
+    Roughly estimates how many bytes a value of `field` takes once it's
+    serialized to JSON, using `SIZE_ESTIMATES`.
+    """
+    if field is None:
+        return SIZE_ESTIMATES['unknown']
+    if isinstance(field, (fields.ObjectIdField, fields.ReferenceField)):
+        return SIZE_ESTIMATES['id']
+    if isinstance(field, fields.StringField):
+        return min(field.max_length or SIZE_ESTIMATES['string'],
+                   SIZE_ESTIMATES['long_string']) + 2
+    primitive = field_type(type(field))
+    if primitive is not None:
+        return SIZE_ESTIMATES.get(primitive, SIZE_ESTIMATES['unknown'])
+    items = SIZE_ESTIMATES['list_items']
+    if isinstance(field, fields.ListField):
+        return items * (estimate_size(field.field, _parents) + 2) + 2
+    if isinstance(field, fields.DictField):
+        return items * (estimate_size(field.field, _parents) +
+                        SIZE_ESTIMATES['dict_key'] + 4) + 2
+    if isinstance(field, fields.EmbeddedDocumentField):
+        if field.document_type in _parents:
+            return SIZE_ESTIMATES['unknown']
+        return document_size(field.document_type, _parents)
+    return SIZE_ESTIMATES['unknown']
+
+
+def property_size(name, value_size):
+    # "name": value, plus the separator
+    return len(name) + value_size + 6
+
+
+def document_size(document, _parents=()):
+    """
+    Estimates the serialized size of a whole `document`.
+    """
+    parents = _parents + (document,)
+    return 2 + sum(property_size(name, estimate_size(field, parents))
+                   for (name, field) in document._fields.iteritems())
+
+
+def resource_field_sizes(resource, memo, depth=RELATED_DEPTH):
+    """
+    Returns `{field name: estimated bytes}` for each field `resource`
+    returns (name and punctuation included).  Related resources are
+    rendered inline, so they count as whole objects, down to `depth`
+    levels.  Results are memoized per resource and depth in `memo`.
+    """
+    key = (resource, depth)
+    if key in memo:
+        return memo[key]
+    related = {}
+    if depth > 0:
+        related = getattr(resource, 'related_resources', None) or {}
+    sizes = OrderedDict()
+    for name in Model.resource_fields(resource):
+        field = resource.document._fields.get(name)
+        if name in related:
+            size = 2 + sum(resource_field_sizes(related[name], memo,
+                                                depth - 1).itervalues())
+            if isinstance(field, fields.ListField):
+                size = SIZE_ESTIMATES['list_items'] * (size + 2) + 2
+        else:
+            size = estimate_size(field)
+        sizes[name] = property_size(name, size)
+    memo[key] = sizes
+    return sizes
+
+
 def view_url_to_swagger(url):
     """
     Converts a view URL with `<>` arguments into Swagger-style `{}` arguments.
@@ -121,6 +523,304 @@ def view_url_to_swagger(url):
     return url.replace('<', '{').replace('>', '}')
 
 
+def freeze(node):
+    """
+    Returns a hashable version of `node`, for `NodeTable`.
+    """
+    if isinstance(node, dict):
+        return (type(node), tuple(sorted(
+            (key, freeze(value)) for (key, value) in node.iteritems())))
+    if isinstance(node, (list, tuple)):
+        return (type(node), tuple(freeze(value) for value in node))
+    # True == 1 == 1.0, but they serialize differently
+    return (type(node), node)
+
+
+def node_size(node, seen=None):
+    """
+    Returns the memory used by `node` and the containers inside it.  If
+    `seen` is a set, containers whose ids are in it aren't counted again.
+    """
+    if seen is not None:
+        if id(node) in seen:
+            return 0
+        seen.add(id(node))
+    size = sys.getsizeof(node)
+    if isinstance(node, dict):
+        size += sum(node_size(value, seen) for value in node.itervalues())
+    elif isinstance(node, (list, tuple)):
+        size += sum(node_size(value, seen) for value in node)
+    return size
+
+
+class NodeTable(object):
+    """
+    Interns spec nodes: equal nodes (Parameters, error responses, ...) are
+    replaced with one shared instance, so they're only stored once.
+    Interned nodes are shared, so they must not be modified.
+    """
+    def __init__(self):
+        self._nodes = {}
+        self.interned = 0
+        self.saved = 0
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def intern(self, node):
+        try:
+            key = freeze(node)
+            shared = self._nodes.setdefault(key, node)
+        except TypeError:  # something unhashable in there
+            return node
+        self.interned += 1
+        if shared is not node:
+            self.saved += node_size(node)
+        return shared
+
+    def report(self):
+        """
+        Returns how many nodes went through the table, how many distinct
+        ones are kept, and roughly how many bytes that saved.
+        """
+        return {'interned': self.interned,
+                'unique': len(self._nodes),
+                'shared': self.interned - len(self._nodes),
+                'bytes_saved': self.saved}
+
+
+def filter_fields(document, memo, _parents=()):
+    """
+    Returns `(path, help_text)` for each field of `document` which can be
+    looked up in a filter, descending into embedded documents (so you get
+    `address__city` rather than `address`).  An embedded document which
+    (eventually) embeds itself isn't descended into again.  Results are
+    memoized per document in `memo`; only the top-level ones, since where
+    the recursion stops depends on the documents above.
+    """
+    if not _parents and document in memo:
+        return memo[document]
+    parents = _parents + (document,)
+    result = []
+    for name, field in document._fields.iteritems():
+        if (isinstance(field, fields.EmbeddedDocumentField) and
+                field.document_type not in parents):
+            result.extend(
+                ('%s__%s' % (name, sub), doc)
+                for (sub, doc) in filter_fields(field.document_type, memo,
+                                                parents))
+        else:
+            result.append((name, getattr(field, 'help_text', None)))
+    if not _parents:
+        memo[document] = result
+    return result
+
+
+def embedded_documents(fields_, _seen=None):
+    """
+    Returns the embedded document classes used by `fields_` (directly, or
+    as the items of lists and dicts), and the ones they embed in turn.
+    """
+    seen = _seen if _seen is not None else []
+    for field in fields_:
+        while isinstance(field, (fields.ListField, fields.DictField)):
+            field = field.field
+        if (isinstance(field, fields.EmbeddedDocumentField) and
+                field.document_type not in seen):
+            seen.append(field.document_type)
+            embedded_documents(field.document_type._fields.values(), seen)
+    return seen
+
+
+def index_keys(document, hashed=False):
+    """
+    Returns the names (both the field names and the names in the database)
+    of the fields on `document` which lead an index, and so can be filtered
+    on without scanning the collection.  Looks at the primary key, unique
+    fields, and both `meta['indexes']` and the `_meta` index specs.  With
+    `hashed`, returns the fields leading a hashed index instead, which only
+    help equality matches.  Text indexes only help `$text` searches, so
+    they're left out.
+    """
+    meta = getattr(document, '_meta', None) or {}
+    specs = (list(getattr(document, 'meta', None) and
+                  document.meta.get('indexes') or []) +
+             list(meta.get('indexes') or []) +
+             list(meta.get('index_specs') or []))
+    keys = set()
+    if not hashed:
+        keys.update(['_id', 'id', 'pk'])
+        for name, field in getattr(document, '_fields', {}).iteritems():
+            if field.primary_key or field.unique:
+                keys.update([name, field.db_field])
+    for spec in specs:
+        if isinstance(spec, dict):
+            spec = spec.get('fields') or []
+        elif isinstance(spec, basestring):
+            spec = [spec]
+        if not spec:
+            continue
+        first, kind = spec[0], None
+        if isinstance(first, (list, tuple)):  # (name, direction)
+            first, kind = first[0], first[1]
+        if first.startswith('$') or kind == 'text':
+            continue
+        if (first.startswith('#') or kind == 'hashed') == hashed:
+            keys.add(first.lstrip('+-#'))
+    # indexes can be declared with either name
+    for name, field in getattr(document, '_fields', {}).iteritems():
+        if name in keys or field.db_field in keys:
+            keys.update([name, field.db_field])
+    return keys
+
+
+def lookup_db_path(document, path):
+    """
+    Converts a filter lookup (`address__city`) into the dotted name of the
+    field in the database (`address.city`, with `db_field`s applied).
+    """
+    names = []
+    for name in path.split('__'):
+        field = getattr(document, '_fields', {}).get(name)
+        if field is None:
+            names.append(name)
+            continue
+        names.append(field.db_field or name)
+        document = getattr(field, 'document_type', None)
+    return '.'.join(names)
+
+
+def unindexed_filters(api):
+    """
+    Returns `{operation nickname: [filters]}` for the operations in `api`
+    which accept filters that aren't backed by an index.
+    """
+    return OrderedDict(
+        (operation['nickname'], operation['x-unindexedFilters'])
+        for endpoint in api
+        for operation in endpoint['operations']
+        if operation.get('x-unindexedFilters'))
+
+
+def vars_of(obj):
+    """
+    Returns `(name, value)` for each (non-private) attribute of `obj`,
+    including the inherited ones.
+    """
+    return [(name, getattr(obj, name))
+            for name in dir(obj) if not name.startswith('_')]
+
+
+def field_fingerprint(field, _parents=()):
+    """
+    Returns a JSON-able summary of everything about `field` which ends up
+    in the documentation, for `Swagger.fingerprint()`.
+    """
+    if field is None:
+        return None
+    data = [type(field).__module__, type(field).__name__,
+            getattr(field, 'db_field', None),
+            getattr(field, 'help_text', None),
+            field.primary_key, bool(field.unique),
+            getattr(field, 'max_length', None),
+            field_fingerprint(getattr(field, 'field', None), _parents)]
+    document = getattr(field, 'document_type', None)
+    if document is not None:
+        data.append(document_fingerprint(document, _parents))
+    return data
+
+
+def document_fingerprint(document, _parents=()):
+    """
+    Returns a JSON-able summary of `document`'s fields and indexes, for
+    `Swagger.fingerprint()`.
+    """
+    if document in _parents:
+        return document.__name__
+    parents = _parents + (document,)
+    meta = getattr(document, '_meta', None) or {}
+    return [document.__module__, document.__name__,
+            sorted((name, field_fingerprint(field, parents))
+                   for (name, field) in document._fields.iteritems()),
+            repr(meta.get('indexes')), repr(meta.get('index_specs'))]
+
+
+def related_fingerprint(resource, depth=RELATED_DEPTH):
+    """
+    Returns a JSON-able summary of the resources related to `resource` (and
+    theirs, down to `depth` levels), for `Swagger.fingerprint()`.
+    """
+    if depth <= 0:
+        return None
+    return sorted((key, document_fingerprint(related.document),
+                   sorted(Model.resource_fields(related)),
+                   related_fingerprint(related, depth - 1))
+                  for (key, related) in
+                  (getattr(resource, 'related_resources', None) or
+                   {}).iteritems())
+
+
+def model_references(type_):
+    """
+    Returns the model names a Swagger type refers to (`List[Model]` refers
+    to `Model`).
+    """
+    list_type = LIST_TYPE.match(type_ or '')
+    if list_type:
+        type_ = list_type.group(1)
+    return [type_] if type_ else []
+
+
+def referenced_models(models, names):
+    """
+    Returns the models in `models` called `names`, along with the ones they
+    refer to through their properties (transitively).
+    """
+    selected = {}
+    names = list(names)
+    while names:
+        name = names.pop()
+        if name in selected or name not in models:
+            continue
+        model = selected[name] = models[name]
+        for prop in model['properties'].itervalues():
+            names.extend(model_references(prop.get('type')))
+            names.extend(model_references(
+                prop.get('items', {}).get('$ref')))
+    return selected
+
+
+def select_api(api, path=(), method=(), nickname=(), model=()):
+    """
+    Returns `(endpoints, models)` with only the parts of `api` matching the
+    given paths, HTTP methods and operation nicknames (all of them, if none
+    are given), plus the models they use.  `model` adds models by id.
+    Only the models are returned if just `model` is given.
+    """
+    http_methods = set(m.upper() for m in method)
+    endpoints = []
+    names = list(model)
+    if path or method or nickname or not model:
+        for endpoint in api:
+            if path and endpoint['path'] not in path:
+                continue
+            operations = [
+                operation for operation in endpoint['operations']
+                if (not http_methods or
+                    operation['httpMethod'] in http_methods) and
+                (not nickname or operation['nickname'] in nickname)]
+            if not operations:
+                continue
+            endpoints.append(dict(endpoint, operations=operations))
+            for operation in operations:
+                names.extend(model_references(
+                    operation.get('responseClass')))
+                for parameter in operation['parameters']:
+                    names.extend(model_references(
+                        parameter.get('dataType')))
+    return endpoints, referenced_models(api.models, names)
+
+
 class Api(list):
     """
     A grouping of Endpoints.
@@ -139,11 +839,182 @@ class Api(list):
         if isinstance(other, Api):
             self.models.update(other.models)
 
+    def merged(self, other):
+        """
+        Returns a new Api with the endpoints (and models) of `other` added,
+        leaving this one alone.
+        """
+        api = Api(list(self), dict(self.models), self.description)
+        api.extend(other)
+        return api
+
+
+class LatencyHistogram(object):
+    """
+    Counts latencies in logarithmic buckets (each 10% wider than the last,
+    from 0.1ms up), so that percentiles can be estimated in constant
+    memory.
+    """
+    BASE = 0.0001
+    FACTOR = 1.1
+    BUCKETS = 180
+
+    def __init__(self):
+        self.counts = [0] * (self.BUCKETS + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        if seconds <= self.BASE:
+            bucket = 0
+        else:
+            bucket = min(self.BUCKETS,
+                         int(math.log(seconds / self.BASE, self.FACTOR)) + 1)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += seconds
+
+    def percentile(self, percent):
+        """
+        Returns the upper bound (in seconds) of the bucket holding the
+        `percent`th percentile, or None if nothing has been counted.
+        """
+        target = self.count * percent / 100.0
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return self.BASE * self.FACTOR ** bucket
+
+    def as_dict(self):
+        if not self.count:
+            return {'count': 0}
+        return {'count': self.count,
+                'mean_ms': self.total / self.count * 1000,
+                'p50_ms': self.percentile(50) * 1000,
+                'p90_ms': self.percentile(90) * 1000,
+                'p99_ms': self.percentile(99) * 1000}
+
+
+class LRUCache(object):
+    """
+    A dictionary which only keeps the `size` most recently used keys.
+    """
+    def __init__(self, size):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class Registry(object):
+    """
+    A snapshot of the registered Apis (and the views not built yet).  It's
+    never modified once it's published: registering something creates a
+    new snapshot, so requests can read the current one without locking.
+    `version` changes whenever clients would see a difference;
+    `changes[name]` is the `(version, last_modified)` of the last change to
+    that Api.
+    """
+    __slots__ = ('apis', 'pending', 'version', 'last_modified', 'changes')
+
+    def __init__(self, apis=None, pending=None, version=0,
+                 last_modified=None, changes=None):
+        self.apis = apis if apis is not None else OrderedDict()
+        self.pending = pending if pending is not None else OrderedDict()
+        self.version = version
+        if last_modified is None:
+            last_modified = datetime.utcnow().replace(microsecond=0)
+        self.last_modified = last_modified
+        self.changes = changes if changes is not None else {}
+
+    def _replace(self, apis=None, pending=None):
+        return Registry(self.apis if apis is None else apis,
+                        self.pending if pending is None else pending,
+                        self.version, self.last_modified, self.changes)
+
+    def changed(self, name):
+        """
+        Returns a copy with a new version and `last_modified`, recording
+        that the Api called `name` changed.
+        """
+        version = self.version + 1
+        last_modified = datetime.utcnow().replace(microsecond=0)
+        changes = dict(self.changes)
+        changes[name] = (version, last_modified)
+        return Registry(self.apis, self.pending, version, last_modified,
+                        changes)
+
+    def changed_since(self, other):
+        """
+        Returns the names of the Apis which changed after `other`.
+        """
+        return [name for (name, change) in self.changes.iteritems()
+                if other.changes.get(name) != change]
+
+    def api_changes(self, name):
+        """
+        Returns the `(version, last_modified)` of the Api called `name`.
+        """
+        return self.changes.get(name, (0, self.last_modified))
+
+    def add_api(self, name, api):
+        apis = OrderedDict(self.apis)
+        if name in apis:
+            apis[name] = apis[name].merged(api)
+        else:
+            apis[name] = api
+        return self._replace(apis=apis)
+
+    def add_pending(self, name, entry):
+        pending = OrderedDict(self.pending)
+        pending[name] = pending.get(name, ()) + (entry,)
+        return self._replace(pending=pending)
+
+    def remove_pending(self, name):
+        pending = OrderedDict(self.pending)
+        del pending[name]
+        return self._replace(pending=pending)
+
 
 class Endpoint(dict):
     """
     Represents an individual API endpoint.
     """
+    __slots__ = ('models',)
+
     def __init__(self, path, description='', operations=None):
         super(Endpoint, self).__init__({
             'path': path,
@@ -156,6 +1027,8 @@ class Operation(dict):
     """
     An Operation is one HTTP method at the given endpoint.
     """
+    __slots__ = ()
+
     def __init__(self, method, nickname, summary='', notes='',
                  response_class='', parameters=None, error_responses=None):
         if parameters is None:
@@ -187,6 +1060,7 @@ class Parameter(dict):
     A Parameter is something passed to the endpoint, in the body, headers,
     path, or query.
     """
+    __slots__ = ()
 
     def __init__(self, param_type, data_type, description='', required=False,
                  multiple=False, values=None, range=None):
@@ -213,6 +1087,8 @@ class Model(dict):
     """
     Represents a Model returned through the Swagger API.
     """
+    __slots__ = ()
+
     def __init__(self, id_, properties=None):
         super(Model, self).__init__({
             'id': id_,
@@ -220,28 +1096,63 @@ class Model(dict):
         })
 
     @classmethod
-    def from_resource(klass, resource):
+    def from_resource(klass, resource, registry=None):
         """
-        Builds a model from a given `mongorest.Resource`.
+        Builds a model from a given `mongorest.Resource`.  If `registry` is
+        given, models are looked up there by document class and field set,
+        so they're only built once.
         """
-        id_ = resource.document.__name__
+        names = klass.resource_fields(resource)
+        if registry is not None:
+            key = (resource.document, tuple(sorted(names)))
+            model = registry.get(key)
+            if model is None:
+                model = registry[key] = klass.from_resource(resource)
+            return model
         properties = {}
+        for name in names:
+            field = resource.document._fields[name]
+            prop = Property.from_field(field)
+            if prop is not None:
+                properties[name] = prop
+        return klass(resource.document.__name__, properties)
+
+    @classmethod
+    def from_document(klass, document, registry=None):
+        """
+        Builds a model with all the fields of `document` (e.g. an embedded
+        document).  `registry` is used as in `from_resource()`.
+        """
+        names = list(document._fields)
+        if registry is not None:
+            key = (document, tuple(sorted(names)))
+            model = registry.get(key)
+            if model is None:
+                model = registry[key] = klass.from_document(document)
+            return model
+        properties = {}
+        for name in names:
+            prop = Property.from_field(document._fields[name])
+            if prop is not None:
+                properties[name] = prop
+        return klass(document.__name__, properties)
+
+    @staticmethod
+    def resource_fields(resource):
+        """
+        Returns the names of the fields `resource` exposes.
+        """
         try:
             fields = resource.get_fields()
         except:
             fields = resource.fields or resource.document._fields
         excluded_fields = getattr(resource, 'excluded_fields', [])
-        for name in fields:
-            if name in excluded_fields:
-                continue
-            field = resource.document._fields[name]
-            prop = Property.from_field(field)
-            if prop is not None:
-                properties[name] = prop
-        return klass(id_, properties)
+        return [name for name in fields if name not in excluded_fields]
 
 
 class Property(dict):
+    __slots__ = ()
+
     def __init__(self, type_, description=None, subtype=None):
         d = dict(type=type_)
         if description:
@@ -255,10 +1166,10 @@ class Property(dict):
         if field is None:
             return
         type_ = subtype = None
-        description = field.help_text
-        if type(field) in FIELD_TO_TYPE:
-            # primitive types
-            type_ = FIELD_TO_TYPE[type(field)]
+        description = getattr(field, 'help_text', None)
+        primitive = field_type(type(field))
+        if primitive is not None:
+            type_ = primitive
         elif isinstance(field, fields.ListField):
             type_ = 'List'
             subprop = klass.from_field(field.field)
@@ -282,13 +1193,47 @@ class Property(dict):
 
 class Swagger(object):
     def __init__(self, mongorest, api_version=None, swagger_version="1.1",
-                 url_prefix=None, document_name='api-docs'):
+                 url_prefix=None, document_name='api-docs',
+                 cache_control='no-cache', static_dir=None,
+                 aggregate_name='swagger', stream=False, stats_name=None,
+                 stats_callbacks=None, base_path=None,
+                 base_path_cache_size=64, warn_unindexed=False,
+                 track_latency=False, metrics_name='api-metrics',
+                 cache_dir=None, render_cache_size=256):
         self.mongorest = mongorest
         self.app = mongorest.app
         self.api_version = api_version
         self.swagger_version = swagger_version
         self.url_prefix = url_prefix or mongorest.url_prefix or ''
         self.document_name = document_name
+        self.cache_control = cache_control
+        # a fixed basePath; by default, it's worked out from each request
+        self.base_path = base_path
+        self._base_paths = LRUCache(base_path_cache_size)
+        # log a warning for each filter without an index as views are built
+        self.warn_unindexed = warn_unindexed
+        # time the requests to registered views, by operation nickname; the
+        # numbers are served at /<metrics_name>.json
+        self.track_latency = track_latency
+        self.latency = {}
+        # keep the built documentation here, keyed by fingerprint(), so
+        # other processes can load it instead of building it again
+        self.cache_dir = cache_dir
+        # set once warm_up() has rendered everything
+        self.ready = threading.Event()
+        self.warm_up_progress = (0, 0)
+        self.warm_up_failures = []
+        # serve the files written by export() instead of generating anything
+        self.static_dir = static_dir
+        # the whole API as a single Swagger 2.0 document is served at
+        # /<aggregate_name>.json; None turns it off
+        self.aggregate_name = aggregate_name
+        # stream declarations instead of caching the rendered bodies; for
+        # very large declarations served by many threads at once
+        self.stream = stream
+        # called with (metric, value, tags) for each measurement; see
+        # add_stats_callback()
+        self.stats_callbacks = list(stats_callbacks or [])
 
         self.blueprint = Blueprint('swagger', __name__)
         self.blueprint.add_url_rule('/%s.json' % document_name,
@@ -299,10 +1244,66 @@ class Swagger(object):
         self.blueprint.add_url_rule('/%s.<format>/<path:name>' % document_name,
                                     view_func=self.api_declaration,
                                     endpoint='declaration')
+        if aggregate_name is not None:
+            self.blueprint.add_url_rule('/%s.json' % aggregate_name,
+                                        view_func=self.api_aggregate,
+                                        endpoint='aggregate')
+        if stats_name is not None:
+            self.blueprint.add_url_rule('/%s.json' % stats_name,
+                                        view_func=self.api_stats,
+                                        endpoint='stats')
+        if track_latency:
+            self.blueprint.add_url_rule('/%s.json' % metrics_name,
+                                        view_func=self.api_metrics,
+                                        endpoint='metrics')
 
         self.app.register_blueprint(self.blueprint, url_prefix=self.url_prefix)
+        self.app.extensions['swagger'] = self
+
+        # held while registering, never while serving
+        self._lock = threading.Lock()
+        self._registry = Registry()
+        self._models = {}
+        self._nodes = NodeTable()
+        self._filter_fields = {}
+        self._filter_tables = {}
+        self._index_keys = {}
+        self._field_sizes = {}
+        # renderings depend on the requested host, so only keep the most
+        # recently used ones
+        self._render_cache = LRUCache(render_cache_size)
+        self.stats = {'cache': {'hits': 0, 'misses': 0},
+                      'builds': {},
+                      'renders': {}}
+
+    @property
+    def _apis(self):
+        return self._registry.apis
+
+    @property
+    def _pending(self):
+        return self._registry.pending
 
-        self._apis = OrderedDict()
+    @property
+    def last_modified(self):
+        return self._registry.last_modified
+
+    def add_stats_callback(self, callback):
+        """
+        Registers `callback(metric, value, tags)` to be called with each
+        measurement, e.g. to forward them to statsd.  The metrics are:
+
+        * `swagger.build` (seconds to introspect a view; tags: api)
+        * `swagger.render` (seconds to render a document; tags: document)
+        * `swagger.size` (bytes in a rendered document; tags: document)
+        * `swagger.cache_hit`/`swagger.cache_miss` (1; tags: document)
+        """
+        self.stats_callbacks.append(callback)
+        return callback
+
+    def _emit(self, metric, value, **tags):
+        for callback in self.stats_callbacks:
+            callback(metric, value, tags)
 
     def register(self, _view=None, **kwargs):
         """
@@ -326,13 +1327,55 @@ class Swagger(object):
 
         def decorator(view):
             self.add_view(view, **kwargs)
-            return register_decorator(view)
+            view = register_decorator(view)
+            if self.track_latency:
+                self._time_view(view)
+            return view
 
         if _view is None:
             return decorator
         else:
             return decorator(_view)
 
+    def _time_view(self, view):
+        """
+        Wraps the view functions Flask-MongoRest registered on this app for
+        `view` to record how long each request takes, in `self.latency`.
+        The view class itself is left alone, so other apps registering it
+        time their own requests.
+        """
+        document_name = view.resource.document.__name__
+        for endpoint, func in self.app.view_functions.items():
+            if (getattr(func, 'view_class', None) is view and
+                    not getattr(func, 'timed', False)):
+                self.app.view_functions[endpoint] = self._timed(
+                    func, document_name)
+
+    def _timed(self, func, document_name):
+        def timed(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                http_method = request.method.lower()
+                if http_method == 'head':
+                    http_method = 'get'
+                method = REQUEST_METHODS.get(
+                    (http_method, kwargs.get('pk') is not None))
+                if method is not None:
+                    nickname = '%s%s' % (method.__name__.lower(),
+                                         document_name)
+                    histogram = self.latency.get(nickname)
+                    if histogram is None:
+                        histogram = self.latency.setdefault(
+                            nickname, LatencyHistogram())
+                    histogram.add(time.time() - start)
+        timed.__name__ = func.__name__
+        timed.__doc__ = func.__doc__
+        timed.view_class = func.view_class
+        timed.timed = True
+        return timed
+
     def route(self, url, **kwargs):
         """
         Wraps `app.route()` to also take Swagger API arguments.  Useful for
@@ -365,10 +1408,23 @@ class Swagger(object):
         if models is None:
             models = []
         api = Api(endpoints, models, description=description)
-        if name in self._apis:
-            self._apis[name].extend(api)
-        else:
-            self._apis[name] = api
+        with self._lock:
+            self._publish(self._registry.add_api(name, api).changed(name))
+
+    def _publish(self, registry):
+        """
+        Makes `registry` the current snapshot.  Must be called with the lock
+        held.  If its version changed, the cached renderings of the index,
+        the aggregate document and the declarations which changed are
+        thrown away; the other declarations are still current.
+        """
+        previous, self._registry = self._registry, registry
+        if registry.version == previous.version:
+            return
+        changed = set(registry.changed_since(previous))
+        for key in list(self._render_cache):
+            if key[0] != 'declaration' or key[1] in changed:
+                self._render_cache.pop(key, None)
 
     def add_view(self, view, **kwargs):
         document_name = view.resource.document.__name__
@@ -382,9 +1438,166 @@ class Swagger(object):
                                   'Operations about %s' % document_name,
                                   **kwargs)
         kwargs['description'] = description
-        endpoints = self.endpoints_from_view(view, name, url, **kwargs)
-        models = self.models_from_view(view)
-        self.add_api(name, endpoints, models, description)
+        # only reserve the Api's place in the index here; the endpoints and
+        # models are introspected the first time they're needed (see build())
+        with self._lock:
+            registry = self._registry
+            if name not in registry.apis:
+                registry = registry.add_api(
+                    name, Api(description=description))
+            registry = registry.add_pending(name, (view, url, kwargs))
+            self._publish(registry.changed(name))
+
+    def build(self, name=None):
+        """
+        Builds the endpoints and models for views registered with `add_view`
+        that haven't been introspected yet.  With `name`, only that Api is
+        built.  Called automatically when a declaration is requested, but
+        can be called ahead of time to warm things up.
+        """
+        if name is None:
+            names = list(self._pending)
+        elif name in self._pending:
+            names = [name]
+        else:
+            return
+        with self._lock:
+            if self.cache_dir is not None and self._registry.pending:
+                self._build_cached()
+            for name in names:
+                # another thread may have gotten here first
+                self._build_api(name)
+
+    def fingerprint(self):
+        """
+        Returns a hash of everything the pending views' documentation is
+        built from: the views, their resources, documents, filters and
+        registration arguments.
+        """
+        data = [CACHE_FORMAT]
+        for name, entries in self._pending.iteritems():
+            for view, url, kwargs in entries:
+                resource = view.resource
+                data.append([
+                    name, url, sorted(kwargs.items()),
+                    view.__module__, view.__name__,
+                    sorted(method.__name__ for method in view.methods),
+                    bool(view.authentication_methods),
+                    resource.__module__, resource.__name__,
+                    document_fingerprint(resource.document),
+                    sorted(Model.resource_fields(resource)),
+                    sorted((key, sorted(f.op for f in filters))
+                           for (key, filters) in
+                           (getattr(resource, 'filters', None) or
+                            {}).iteritems()),
+                    related_fingerprint(resource),
+                    getattr(resource, 'max_limit', None),
+                    getattr(resource, 'default_limit', None)] +
+                    [[key, value]
+                     for (key, value) in sorted(vars_of(resource))
+                     if key.endswith(('_description', '_summary',
+                                      '_notes', 'parameters',
+                                      'error_responses')) and
+                     not callable(value)])
+        return hashlib.sha1(json.dumps(data, sort_keys=True,
+                                       default=repr)).hexdigest()
+
+    def _build_cached(self):
+        """
+        Builds all the pending views, using the files in `cache_dir`: if
+        there's one for the current fingerprint, it's loaded instead of
+        introspecting anything; otherwise everything is built and saved
+        there.  Must be called with the lock held.
+        """
+        path = os.path.join(self.cache_dir, '%s.json' % self.fingerprint())
+        try:
+            with open(path, 'rb') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            data = None
+        if data is not None:
+            for name, apis in data:
+                registry = self._registry
+                if name not in registry.pending:
+                    continue
+                start = time.time()
+                for api in apis:
+                    registry = registry.add_api(name, self._load_api(api))
+                self._record_build(name, time.time() - start)
+                self._publish_built(registry, name)
+            return
+        data = [(name, [{'description': api.description,
+                         'endpoints': api,
+                         'models': api.models}
+                        for api in self._build_api(name)])
+                for name in list(self._pending)]
+        makedirs(self.cache_dir)
+        f = tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix='.tmp',
+                                        delete=False)
+        try:
+            with f:
+                f.write(dumps(data))
+            os.rename(f.name, path)
+        except (IOError, OSError):
+            logger.warning('could not write the Swagger cache to %s', path,
+                           exc_info=True)
+            if os.path.exists(f.name):
+                os.unlink(f.name)
+
+    def _load_api(self, data):
+        """
+        Rebuilds an Api saved by `_build_cached()`, interning its nodes like
+        the ones built from views.
+        """
+        endpoints = [
+            Endpoint(endpoint['path'], endpoint['description'],
+                     [self._intern_operation(operation)
+                      for operation in endpoint['operations']])
+            for endpoint in data['endpoints']]
+        models = {}
+        for id_, model in data['models'].iteritems():
+            models[id_] = Model(id_)
+            models[id_].update(model)
+        return Api(endpoints, models, data['description'])
+
+    def _build_api(self, name):
+        """
+        Builds the pending views for `name`, then publishes the result.
+        Returns the Api built for each view.  Must be called with the lock
+        held.
+        """
+        registry = self._registry
+        built = []
+        for view, url, kwargs in registry.pending.get(name, ()):
+            start = time.time()
+            endpoints = self.endpoints_from_view(view, name, url, **kwargs)
+            models = self.models_from_view(view)
+            api = Api(endpoints, models, kwargs['description'])
+            built.append(api)
+            registry = registry.add_api(name, api)
+            self._record_build(name, time.time() - start)
+        if name in registry.pending:
+            self._publish_built(registry, name)
+        return built
+
+    def _record_build(self, name, elapsed):
+        self.stats['builds'][name] = (
+            self.stats['builds'].get(name, 0) + elapsed)
+        self._emit('swagger.build', elapsed, api=name)
+
+    def _publish_built(self, registry, name):
+        """
+        Publishes `registry`, where the Api called `name` is now built (its
+        pending views are dropped).  Must be called with the lock held.
+        """
+        if self.warn_unindexed:
+            for nickname, keys in unindexed_filters(
+                    registry.apis[name]).iteritems():
+                logger.warning('%s: filters without an index: %s',
+                               nickname, ', '.join(keys))
+        # not a change as far as clients are concerned (no new version):
+        # they've never seen this declaration without these endpoints
+        self._publish(registry.remove_pending(name))
 
     def add_func(self, func, name=None, endpoints=None, models=None,
                  description=''):
@@ -423,6 +1636,7 @@ class Swagger(object):
         document_name_lower = document_name.lower()  # noqa
         parameters = {}
         error_responses = {}
+        unindexed = []
         if _view.authentication_methods:
             error_responses[401] = 'Invalid authentication'
         if method in DETAIL_METHODS:
@@ -444,38 +1658,22 @@ class Swagger(object):
                 '_limit': Parameter(
                     'query', 'int',
                     'The maximum number of records to return',
-                    range=(1, 1000))})
-            if hasattr(resource, 'filters'):
-                for name, filters in resource.filters.iteritems():
-                    for f in filters:
-                        field = resource.document._fields[name]
-                        if isinstance(
-                                field,
-                                fields.EmbeddedDocumentField):
-                            # this is a lookup which allows us to
-                            # query subfields; throw them in as
-                            # well
-                            names, subfields = zip(
-                                *field.document_type._fields.items())
-                            keys = [
-                                '%s__%s' % (name, sub)
-                                for sub in names]
-                            docs = [sub.help_text for sub in subfields]
-                        else:
-                            keys = [name]
-                            docs = [field.help_text]
-                        keys = [(key if f.op in ('', 'exact') else
-                               '%s__%s' % (key, f.op))
-                                for key in keys]
-                        for key, doc in zip(keys, docs):
-                            parameters[key] = Parameter(
-                                'query', 'string',
-                                first_value(
-                                    '%s_description' % key,
-                                    resource,
-                                    doc,
-                                    key.rsplit('__', 1)[-1].title(),
-                                    **kwargs))
+                    range=(1, getattr(resource, 'max_limit', None) or
+                           1000))})
+            for key, doc, indexed in self.filter_table(resource):
+                parameters[key] = Parameter(
+                    'query', 'string',
+                    first_value(
+                        '%s_description' % key,
+                        resource,
+                        doc,
+                        key.rsplit('__', 1)[-1].title(),
+                        **kwargs))
+                parameters[key]['x-indexed'] = indexed
+                if not indexed:
+                    unindexed.append(key)
+            # skipped records are still read from the collection
+            parameters['_skip']['x-indexed'] = False
         for extra in all_values('parameters', resource, {}, **kwargs):
             parameters.update(extra)
         view_args = VIEW_ARGS.findall(path)
@@ -489,7 +1687,7 @@ class Swagger(object):
                     parameters[arg] = Parameter(
                         'path', 'string',
                         description)
-        return Operation(
+        operation = Operation(
             method.method,
             '%s%s' % (
                 method.__name__.lower(), document_name),
@@ -503,43 +1701,920 @@ class Swagger(object):
             response_class=document_name,
             parameters=parameters,
             error_responses=error_responses)
+        if unindexed:
+            operation['x-unindexedFilters'] = sorted(unindexed)
+        if method in (methods.List, methods.Fetch):
+            self._add_size_estimates(operation, resource, method)
+        return self._intern_operation(operation)
+
+    def _intern_operation(self, operation):
+        # the same parameters (_fields, _skip, filters...) and error
+        # responses show up in most operations; only keep one copy of each
+        for key in ('parameters', 'errorResponses'):
+            operation[key] = [self._nodes.intern(node)
+                              for node in operation[key]]
+        return operation
+
+    def _add_size_estimates(self, operation, resource, method):
+        """
+        Adds the estimated size of each item, of a page of them (for List),
+        and what leaving out each field with `_fields` saves per item, to
+        `operation`.
+        """
+        sizes = resource_field_sizes(resource, self._field_sizes)
+        item_size = 2 + sum(sizes.itervalues())
+        operation['x-estimatedItemSize'] = item_size
+        operation['x-estimatedFieldSizes'] = sizes
+        if method == methods.List:
+            page = (getattr(resource, 'default_limit', None) or
+                    getattr(resource, 'max_limit', None) or 100)
+            operation['x-estimatedPageSize'] = (
+                SIZE_ESTIMATES['page_envelope'] + page * (item_size + 2))
+
+    def filter_table(self, resource):
+        """
+        Returns `(key, help_text, indexed)` for each query parameter
+        accepted by the filters on `resource`.  Filters on embedded
+        documents allow lookups on their subfields, so those are expanded
+        (recursively) as well.  `indexed` is True if an index leads with the
+        field being filtered on, and the filter's operator can use it (see
+        `UNINDEXED_OPERATORS` and `HASHED_OPERATORS`).  Computed once per
+        resource.
+        """
+        table = self._filter_tables.get(resource)
+        if table is not None:
+            return table
+        table = []
+        document = resource.document
+        keys = self._index_keys.get(document)
+        if keys is None:
+            keys = self._index_keys[document] = (
+                index_keys(document), index_keys(document, hashed=True))
+        indexed, hashed = keys
+
+        def leads(key, keys):
+            return key in keys or lookup_db_path(document, key) in keys
+        for name, filters in (getattr(resource, 'filters', None) or
+                              {}).iteritems():
+            field = resource.document._fields[name]
+            if isinstance(field, fields.EmbeddedDocumentField):
+                lookups = [
+                    ('%s__%s' % (name, sub), doc)
+                    for (sub, doc) in filter_fields(field.document_type,
+                                                    self._filter_fields)]
+            else:
+                lookups = [(name, getattr(field, 'help_text', None))]
+            lookups = [(key, doc, leads(key, indexed), leads(key, hashed))
+                       for (key, doc) in lookups]
+            for f in filters:
+                for key, doc, key_indexed, key_hashed in lookups:
+                    if f.op not in ('', 'exact'):
+                        key = '%s__%s' % (key, f.op)
+                    table.append((key, doc,
+                                  (key_indexed and
+                                   f.op not in UNINDEXED_OPERATORS) or
+                                  (key_hashed and f.op in HASHED_OPERATORS)))
+        self._filter_tables[resource] = table
+        return table
 
     def models_from_view(self, view):
-        model = Model.from_resource(view.resource)
-        models = {model['id']: model}
-        for resource in view.resource.related_resources.values():
-            model = Model.from_resource(resource)
+        """
+        Returns the models for `view`'s resource, its related resources and
+        the embedded documents they expose.
+        """
+        models = {}
+        for resource in ([view.resource] +
+                         view.resource.related_resources.values()):
+            model = Model.from_resource(resource, self._models)
             models[model['id']] = model
+            for document in embedded_documents(
+                    resource.document._fields[name]
+                    for name in Model.resource_fields(resource)):
+                model = Model.from_document(document, self._models)
+                models[model['id']] = model
         return models
 
-    def _base_data(self, **kwargs):
-        adapter = self.app.create_url_adapter(request)
+    def index_report(self):
+        """
+        Builds everything, then returns the filters which aren't backed by
+        an index: `{api name: {operation nickname: [filters]}}`.
+        """
+        self.build()
+        report = OrderedDict()
+        for name, api in self._apis.iteritems():
+            unindexed = unindexed_filters(api)
+            if unindexed:
+                report[name] = unindexed
+        return report
+
+    def memory_report(self):
+        """
+        Returns some numbers about the memory used by the (built) registry:
+        how many nodes there are, how many bytes the operations take, and
+        how much interning their nodes saved.
+        """
+        operations = [operation
+                      for api in self._apis.itervalues()
+                      for endpoint in api
+                      for operation in endpoint['operations']]
+        report = {
+            'apis': len(self._apis),
+            'operations': len(operations),
+            'parameters': sum(len(operation['parameters'])
+                              for operation in operations),
+            'models': len(self._models),
+            'bytes': node_size(operations, set())}
+        report['nodes'] = self._nodes.report()
+        return report
+
+    def _base_path(self):
+        """
+        Returns the `basePath` for the current request: `base_path` if it
+        was given, otherwise the URL of `url_prefix` on the requested host.
+        Cached per scheme, host and script root.
+        """
+        return self._base_path_for(request.environ['wsgi.url_scheme'],
+                                   request.host, request.script_root)
+
+    def _base_path_for(self, scheme, host, script_root):
+        if self.base_path is not None:
+            return self.base_path
+        key = (scheme, host, script_root)
+        base_path = self._base_paths.get(key)
+        if base_path is None:
+            base_path = self._base_paths[key] = '%s://%s/%s' % (
+                scheme, host, posixpath.join(script_root.strip('/'),
+                                             self.url_prefix.lstrip('/')))
+        return base_path
+
+    def declaration_path(self, format, name):
+        """
+        Returns the path of the declaration for `name`, relative to
+        `url_prefix`.
+        """
+        return '/%s.%s/%s' % (self.document_name, format, url_quote(name))
+
+    def _base_data(self, base_path, **kwargs):
         data = dict({
             'swaggerVersion': self.swagger_version,
-            'basePath': adapter.make_redirect_url(self.url_prefix),
+            'basePath': base_path,
         }, **kwargs)
         if self.api_version is not None:
             data['apiVersion'] = self.api_version
         return data
 
+    def _render(self, key, builder, last_modified=None):
+        """
+        Returns the `Rendering` for `key`, calling `builder` to generate the
+        data the first time.  Renderings are thrown away when what they were
+        built from changes (see `_publish()`).
+        """
+        document = key[1] if key[0] == 'declaration' else key[0]
+        rendering = self._render_cache.get(key)
+        if rendering is not None:
+            self.stats['cache']['hits'] += 1
+            self._emit('swagger.cache_hit', 1, document=document)
+            return rendering
+        self.stats['cache']['misses'] += 1
+        self._emit('swagger.cache_miss', 1, document=document)
+        start = time.time()
+        rendering = self._render_cache[key] = Rendering(
+            dumps(builder()), last_modified=last_modified)
+        elapsed = time.time() - start
+        stats = self.stats['renders'].setdefault(
+            document, {'count': 0, 'seconds': 0, 'size': 0})
+        stats['count'] += 1
+        stats['seconds'] += elapsed
+        stats['size'] = len(rendering.body)
+        self._emit('swagger.render', elapsed, document=document)
+        self._emit('swagger.size', len(rendering.body), document=document)
+        return rendering
+
+    def cached_rendering(self, scheme, host, script_root, format, name=None):
+        """
+        Returns the `Rendering` of the index (or of the declaration for
+        `name`) for a request to `scheme://host/script_root`, if it's
+        already been rendered.  Otherwise, returns None.
+        """
+        if format not in FORMATS:
+            return
+        if self.static_dir is not None:
+            key = ('static', self.export_path(format, name))
+        else:
+            registry = self._registry
+            base_path = self._base_path_for(scheme, host, script_root)
+            if name is None:
+                key = ('index', format, base_path, registry.version)
+            elif name in registry.apis and name not in registry.pending:
+                key = ('declaration', name, format, base_path,
+                       registry.api_changes(name)[0])
+            else:
+                return
+        rendering = self._render_cache.get(key)
+        if rendering is not None:
+            self.stats['cache']['hits'] += 1
+            self._emit('swagger.cache_hit', 1, document=name or 'index')
+        return rendering
+
+    def _respond(self, rendering):
+        """
+        Serves `rendering`, compressed if the client accepts it, answering
+        with a 304 if the client already has it.
+        """
+        encoding, body, etag = rendering.negotiate(request.accept_encodings)
+        response = json_response(body)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        if rendering.encoded:
+            response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+        response.last_modified = rendering.last_modified or self.last_modified
+        if self.cache_control:
+            response.headers['Cache-Control'] = self.cache_control
+        return response.make_conditional(request)
+
+    def _index_rendering(self, format):
+        if self.static_dir is not None:
+            return self._static_rendering(self.export_path(format))
+        registry = self._registry
+        base_path = self._base_path()
+
+        def build():
+            apis = []
+            for name, api in registry.apis.iteritems():
+                apis.append({
+                    'path': self.declaration_path(format, name),
+                    'description': api.description
+                })
+            return self._base_data(base_path, apis=apis)
+
+        return self._render(('index', format, base_path, registry.version),
+                            build)
+
+    def _declaration_rendering(self, format, name):
+        if self.static_dir is not None:
+            return self._static_rendering(self.export_path(format, name))
+        self.build(name)
+        registry = self._registry
+        api = registry.apis.get(name)
+        if api is None:
+            return
+        base_path = self._base_path()
+
+        def build():
+            return self._declaration_data(format, name, api, base_path)
+
+        # keyed by the version of this Api, so changes to the others don't
+        # invalidate it
+        version, last_modified = registry.api_changes(name)
+        return self._render(
+            ('declaration', name, format, base_path, version), build,
+            last_modified)
+
+    def _declaration_data(self, format, name, api, base_path):
+        return self._base_data(
+            base_path,
+            resourcePath=self.declaration_path(format, name),
+            apis=api,
+            models=api.models)
+
+    def _aggregate_rendering(self):
+        if self.static_dir is not None:
+            return self._static_rendering(self.export_path(
+                'json', aggregate=True))
+        self.build()
+        registry = self._registry
+        base_path = self._base_path()
+
+        def build():
+            return self._aggregate_data(registry.apis, base_path)
+
+        return self._render(('aggregate', base_path, registry.version), build)
+
+    def _aggregate_data(self, apis, base_path):
+        """
+        Converts `apis` into a single Swagger 2.0 document.  Models are only
+        listed once, in `definitions`; if Apis have different models with
+        the same id (different fields of the same document), the later ones
+        are listed as `<id>_<api name>`.
+        """
+        definitions = {}
+        names = {}  # {api name: {model id: definition name}}
+        for name, api in apis.iteritems():
+            names[name] = {}
+            for id_, model in api.models.iteritems():
+                key = id_
+                if key in definitions and definitions[key][0] != model:
+                    key = '%s_%s' % (id_, DEFINITION_CHARS.sub('_', name))
+                    while (key in definitions and
+                           definitions[key][0] != model):
+                        key += '_'
+                definitions.setdefault(key, (model, names[name]))
+                names[name][id_] = key
+        paths = OrderedDict()
+        tags = []
+        for name, api in apis.iteritems():
+            tags.append({'name': name, 'description': api.description})
+            for endpoint in api:
+                path = paths.setdefault(endpoint['path'], {})
+                for operation in endpoint['operations']:
+                    path[operation['httpMethod'].lower()] = \
+                        swagger2_operation(operation, name, names[name])
+        url = urlsplit(base_path)
+        return {
+            'swagger': '2.0',
+            'info': {'title': self.app.name,
+                     'version': self.api_version or ''},
+            'host': url.netloc,
+            'basePath': url.path.rstrip('/') or '/',
+            'schemes': [url.scheme],
+            'consumes': ['application/json'],
+            'produces': ['application/json'],
+            'tags': tags,
+            'paths': paths,
+            'definitions': dict(
+                (key, swagger2_model(model, models))
+                for (key, (model, models)) in definitions.iteritems())}
+
+    def _static_rendering(self, path):
+        if path is None:
+            return
+        key = ('static', path)
+        rendering = self._render_cache.get(key)
+        if rendering is None:
+            path = os.path.join(self.static_dir, path)
+            if not os.path.isfile(path):
+                return
+            rendering = self._render_cache[key] = Rendering.from_file(path)
+        return rendering
+
+    def export_path(self, format, name=None, aggregate=False):
+        """
+        Returns the path, relative to the export directory, of the index
+        (or the declaration for `name`, or with `aggregate` the Swagger 2.0
+        document).  None if `name` would escape the directory.
+        """
+        if aggregate:
+            return '%s.json' % self.aggregate_name
+        if name is None:
+            return '%s.%s' % (self.document_name, format)
+        parts = name.split('/')
+        if '..' in parts or '' in parts:
+            return
+        return os.path.join(self.document_name, '%s.%s' % (
+            os.path.join(*parts), format))
+
+    def export(self, directory, base_url='http://localhost/', format='json',
+               compress=False):
+        """
+        Writes the index and every declaration into `directory` (see
+        `export_path()`), to be served later with `static_dir`.  With
+        `compress`, the pre-compressed copies are written next to them as
+        well.  The Swagger 2.0 document is exported too, unless it's turned
+        off.  `base_url` is the URL the documentation will be served from;
+        it's used to build `basePath`.
+        """
+        with self.app.test_request_context(base_url=base_url):
+            self.build()
+            renderings = [(self.export_path(format),
+                           self._index_rendering(format))]
+            for name in self._apis:
+                renderings.append((self.export_path(format, name),
+                                   self._declaration_rendering(format, name)))
+            if self.aggregate_name is not None:
+                renderings.append((self.export_path(format, aggregate=True),
+                                   self._aggregate_rendering()))
+        for path, rendering in renderings:
+            if path is None:
+                continue
+            rendering.write(os.path.join(directory, path), compress)
+
+    def _selection(self):
+        """
+        Returns the `SELECTION_ARGS` given in the query string, each as a
+        list (they can be repeated or comma-separated).
+        """
+        selection = {}
+        for key in SELECTION_ARGS:
+            values = [value
+                      for arg in request.args.getlist(key)
+                      for value in arg.split(',') if value]
+            if values:
+                selection[key] = values
+        return selection
+
+    def _partial_rendering(self, format, names, selection):
+        """
+        Renders only the selected parts of the declarations for `names`:
+        a single declaration if `names` is a string, otherwise a batch
+        `{"declarations": [...]}`.  These aren't cached (there are too many
+        combinations), or compressed.
+        """
+        base_path = self._base_path()
+        declarations = []
+        for name in ([names] if isinstance(names, basestring) else names):
+            self.build(name)
+            api = self._apis.get(name)
+            if api is None:
+                if isinstance(names, basestring):
+                    return
+                continue
+            endpoints, models = select_api(api, **selection)
+            declarations.append(self._base_data(
+                base_path,
+                resourcePath=self.declaration_path(format, name),
+                apis=endpoints,
+                models=models))
+        if isinstance(names, basestring):
+            data = declarations[0]
+        else:
+            data = self._base_data(base_path, declarations=declarations)
+        return Rendering(dumps(data), encoded={})
+
+    def warm_up(self, base_urls=('http://localhost/',), threads=4,
+                callback=None):
+        """
+        Builds, renders and compresses the index, every declaration and the
+        aggregate document in the background, using a pool of `threads`
+        threads, so that the first requests don't pay for it.  Renderings
+        depend on the host, so `base_urls` should be the URL(s) the
+        documentation is served from.
+
+        `warm_up_progress` is `(done, total)` as it goes, `callback(done,
+        total, failures)` is called after each document, and `ready` is set
+        once everything's been rendered.  Documents that couldn't be rendered
+        are listed in `warm_up_failures` as `(base_url, kind, name, error)`,
+        and leave `ready` unset.  Returns the (daemon) thread doing the work.
+        """
+        if isinstance(base_urls, basestring):
+            base_urls = [base_urls]
+        documents = ([('index', None)] +
+                     [('declaration', name) for name in self._apis])
+        if self.aggregate_name is not None:
+            documents.append(('aggregate', None))
+        jobs = [(base_url, kind, name)
+                for base_url in base_urls
+                for (kind, name) in documents]
+        self.ready.clear()
+        self.warm_up_progress = (0, len(jobs))
+        self.warm_up_failures = failures = []
+
+        def render(job):
+            base_url, kind, name = job
+            try:
+                with self.app.test_request_context(base_url=base_url):
+                    if kind == 'index':
+                        self._index_rendering('json')
+                    elif kind == 'declaration':
+                        self._declaration_rendering('json', name)
+                    else:
+                        self._aggregate_rendering()
+            except Exception as e:
+                logger.exception('could not warm up %s %s for %s', kind,
+                                 name or '', base_url)
+                failures.append((base_url, kind, name, e))
+
+        def run():
+            pool = ThreadPool(threads)
+            try:
+                for done, _ in enumerate(pool.imap_unordered(render, jobs),
+                                         1):
+                    self.warm_up_progress = (done, len(jobs))
+                    if callback is not None:
+                        callback(done, len(jobs), list(failures))
+            finally:
+                pool.close()
+                pool.join()
+            # only ready once everything's hot
+            if not failures:
+                self.ready.set()
+
+        thread = threading.Thread(target=run, name='swagger-warm-up')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def generate_client(self, base_url='http://localhost/',
+                        class_name='Client'):
+        """
+        Returns the source of a Python client module for the API served at
+        `base_url`; see `generate_client()`.
+        """
+        with self.app.test_request_context(base_url=base_url):
+            self.build()
+            return generate_client(self._apis, self._base_path(), class_name,
+                                   self.app.name)
+
     def api_docs(self, format='json'):
-        apis = []
-        skip = len(self.url_prefix)
-        for name, api in self._apis.iteritems():
-            apis.append({
-                'path': url_for('.declaration', format=format,
-                                name=name)[skip:],
-                'description': api.description
-            })
-        return jsonify(self._base_data(apis=apis))
+        names = [name
+                 for arg in request.args.getlist('name')
+                 for name in arg.split(',') if name]
+        if names and self.static_dir is None:
+            if names == ['*']:
+                names = list(self._apis)
+            return self._respond(self._partial_rendering(
+                format, names, self._selection()))
+        return self._respond(self._index_rendering(format))
+
+    def _stream(self, data, last_modified):
+        """
+        Serves `data` without holding the whole serialized body in memory.
+        There's no ETag, since that would need the body up front.  The
+        conditional request is answered here rather than with
+        `make_conditional()`, which would read the whole body to set
+        `Content-Length`.
+        """
+        if is_resource_modified(request.environ,
+                                last_modified=last_modified):
+            response = Response(iterdumps(data),
+                                mimetype='application/json')
+        else:
+            response = Response(status=304)
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        response.last_modified = last_modified
+        if self.cache_control:
+            response.headers['Cache-Control'] = self.cache_control
+        return response
 
     def api_declaration(self, format, name):
-        api = self._apis.get(name)
-        if api is None:
+        if format not in FORMATS:
             abort(404)
-        skip = len(self.url_prefix)
-        return jsonify(self._base_data(
-            resourcePath=url_for('.declaration', format=format,
-                                 name=name)[skip:],
-            apis=api,
-            models=api.models))
+        selection = self._selection()
+        if selection and self.static_dir is None:
+            rendering = self._partial_rendering(format, name, selection)
+            if rendering is None:
+                abort(404)
+            return self._respond(rendering)
+        if self.stream and self.static_dir is None:
+            self.build(name)
+            registry = self._registry
+            api = registry.apis.get(name)
+            if api is None:
+                abort(404)
+            return self._stream(
+                self._declaration_data(format, name, api, self._base_path()),
+                registry.api_changes(name)[1])
+        rendering = self._declaration_rendering(format, name)
+        if rendering is None:
+            abort(404)
+        return self._respond(rendering)
+
+    def api_stats(self):
+        registry = self._registry
+        apis = {}
+        for name, api in registry.apis.iteritems():
+            operations = [operation
+                          for endpoint in api
+                          for operation in endpoint['operations']]
+            apis[name] = {
+                'built': name not in registry.pending,
+                'operations': len(operations),
+                'parameters': sum(len(operation['parameters'])
+                                  for operation in operations),
+                'models': len(api.models)}
+        return jsonify(dict(self.stats, apis=apis))
+
+    def api_metrics(self):
+        return jsonify(dict(
+            (nickname, histogram.as_dict())
+            for (nickname, histogram) in self.latency.items()))
+
+    def api_aggregate(self):
+        rendering = self._aggregate_rendering()
+        if rendering is None:
+            abort(404)
+        return self._respond(rendering)
+
+
+class SwaggerMiddleware(object):
+    """
+    WSGI middleware which answers requests for documentation that's already
+    been rendered straight from the `Swagger` render cache, without going
+    through Flask.  Anything else (including documentation that hasn't been
+    rendered yet, and requests with a query string) is passed on::
+
+        app.wsgi_app = SwaggerMiddleware(swagger, app.wsgi_app)
+    """
+    def __init__(self, swagger, wsgi_app):
+        self.swagger = swagger
+        self.wsgi_app = wsgi_app
+        prefix = '%s/%s' % (swagger.url_prefix, swagger.document_name)
+        self.index_path = prefix + '.json'
+        self.declaration_prefix = prefix + '.'
+
+    def __call__(self, environ, start_response):
+        rendering = self.lookup(environ)
+        if rendering is None:
+            return self.wsgi_app(environ, start_response)
+        return self.serve(rendering, environ, start_response)
+
+    def lookup(self, environ):
+        """
+        Returns the cached `Rendering` answering the request, or None.
+        """
+        if (environ.get('REQUEST_METHOD') not in ('GET', 'HEAD') or
+                environ.get('QUERY_STRING')):
+            return
+        path = environ.get('PATH_INFO', '')
+        if path == self.index_path:
+            format, name = 'json', None
+        elif path.startswith(self.declaration_prefix):
+            format, _, name = path[len(self.declaration_prefix):].partition(
+                '/')
+            if not name:
+                return
+        else:
+            return
+        return self.swagger.cached_rendering(
+            environ['wsgi.url_scheme'], get_host(environ),
+            environ.get('SCRIPT_NAME', '').rstrip('/'), format, name)
+
+    def serve(self, rendering, environ, start_response):
+        """
+        Sends `rendering` with the same headers (and conditional request
+        handling) as the Swagger routes.
+        """
+        encoding, body, etag = rendering.negotiate(
+            parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING')))
+        last_modified = rendering.last_modified or self.swagger.last_modified
+        headers = [('Access-Control-Allow-Origin', '*'),
+                   ('ETag', quote_etag(etag)),
+                   ('Last-Modified', http_date(last_modified))]
+        if self.swagger.cache_control:
+            headers.append(('Cache-Control', self.swagger.cache_control))
+        if rendering.encoded:
+            headers.append(('Vary', 'Accept-Encoding'))
+        if not is_resource_modified(environ, etag,
+                                    last_modified=last_modified):
+            start_response('304 Not Modified', headers)
+            return []
+        headers.extend([('Content-Type', 'application/json'),
+                        ('Content-Length', str(len(body)))])
+        if encoding is not None:
+            headers.append(('Content-Encoding', encoding))
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        return [body]
+
+
+CLIENT_HEADER = '''\
+"""
+Client for the %(title)s API.
+
+Generated by Flask-MongoRest-Swagger; don't edit it by hand.
+"""
+import requests
+from requests.adapters import HTTPAdapter
+try:
+    from urllib import quote
+except ImportError:
+    from urllib.parse import quote  # noqa
+
+BASE_URL = %(base_url)r
+
+
+class %(class_name)s(object):
+    """
+    Calls the API through one `requests.Session`, so connections are pooled
+    and kept alive between calls.
+    """
+    def __init__(self, base_url=BASE_URL, session=None, pool_size=10):
+        self.base_url = base_url.rstrip('/')
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size,
+                                  pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+    def _path(self, template, **args):
+        return template.format(**dict(
+            (key, quote(str(value), safe=''))
+            for (key, value) in args.items()))
+
+    def _request(self, method, path, params=None, data=None):
+        params = dict((key, ','.join(value)
+                       if isinstance(value, (list, tuple)) else value)
+                      for (key, value) in (params or {}).items()
+                      if value is not None)
+        response = self.session.request(method, self.base_url + path,
+                                        params=params, json=data)
+        response.raise_for_status()
+        if response.content:
+            return response.json()
+
+    def _pages(self, method, page_size, kwargs):
+        skip = kwargs.pop('_skip', None) or 0
+        while True:
+            page = method(_skip=skip, _limit=page_size, **kwargs)
+            items = page.get('data', []) if isinstance(page, dict) else page
+            for item in items:
+                yield item
+            if len(items) < page_size or (isinstance(page, dict) and
+                                          not page.get('has_more', True)):
+                return
+            skip += len(items)
+
+    def _batches(self, method, data, ids, batch_size, id_filter):
+        results = []
+        ids = [str(id_) for id_ in ids]
+        for start in range(0, len(ids), batch_size):
+            params = {id_filter: ids[start:start + batch_size]}
+            results.append(method(data, **params))
+        return results
+'''
+
+CLIENT_METHOD = '''
+    def %(name)s(self%(arguments)s):
+        """
+%(doc)s
+        """
+        return self._request(
+            %(method)r, self._path(%(path)r%(path_args)s),
+            %(params)s%(data)s)
+'''
+
+CLIENT_PAGES = '''
+    def iter_%(name)s(self, page_size=100, **kwargs):
+        """
+        Yields every result of `%(method)s()`, fetching `page_size` at a
+        time.
+        """
+        return self._pages(self.%(method)s, page_size, kwargs)
+'''
+
+CLIENT_BATCHES = '''
+    def batch_%(name)s(self, data, ids, batch_size=100, id_filter='id__in'):
+        """
+        Applies `data` to the given ids through `%(method)s()`,
+        `batch_size` ids per request.  The resource needs a filter on the
+        ids (`id_filter`).
+        """
+        return self._batches(self.%(method)s, data, ids, batch_size,
+                             id_filter)
+'''
+
+PYTHON_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+# the generated client runs on Python 2 and 3, so neither's keywords will do
+PYTHON_KEYWORDS = frozenset(keyword.kwlist + [
+    'False', 'None', 'True', 'async', 'await', 'exec', 'nonlocal', 'print'])
+# attributes the client class defines itself
+CLIENT_ATTRIBUTES = ('base_url', 'session', '_path', '_request', '_pages',
+                     '_batches')
+
+
+def check_python_name(name, what):
+    """
+    Raises ValueError unless `name` can be used as a name in the generated
+    client.
+    """
+    if not PYTHON_NAME.match(name) or name in PYTHON_KEYWORDS:
+        raise ValueError('cannot generate a client: %s %r is not a valid '
+                         'Python name' % (what, name))
+    return name
+
+
+def python_name(nickname):
+    """
+    Converts an operation nickname (`bulkupdateUser`) into a method name
+    (`bulkupdate_user`).
+    """
+    return re.sub(r'(?<=[a-z0-9])([A-Z])', r'_\1', nickname).lower()
+
+
+def generate_client(apis, base_url, class_name='Client', title='API'):
+    """
+    Returns the source of a Python module with a client for `apis` (as in
+    `Swagger._apis`), which calls the API at `base_url`.  There's a method
+    for each operation, named after its nickname, plus `iter_*` methods to
+    page through List operations and `batch_*` methods to send BulkUpdates
+    in batches.  The client needs `requests`.
+
+    Raises ValueError if a nickname or path argument doesn't make a valid
+    Python name, or if two operations would get the same method.
+    """
+    check_python_name(class_name, 'class name')
+    source = [CLIENT_HEADER % {'title': title, 'base_url': base_url,
+                               'class_name': class_name}]
+    defined = dict((name, 'the client itself')
+                   for name in CLIENT_ATTRIBUTES)
+    for api in apis.itervalues():
+        for endpoint in api:
+            for operation in endpoint['operations']:
+                for name, method in client_methods(endpoint['path'],
+                                                   operation):
+                    if name in defined:
+                        raise ValueError(
+                            'cannot generate a client: %s() would be '
+                            'defined for both %s and operation %s' % (
+                                name, defined[name], operation['nickname']))
+                    defined[name] = 'operation %s' % operation['nickname']
+                    source.append(method)
+    return ''.join(source)
+
+
+def client_methods(path, operation):
+    """
+    Returns `(name, source)` for each client method generated for
+    `operation`.
+    """
+    name = check_python_name(python_name(operation['nickname']),
+                             'method name (from nickname %r)' %
+                             operation['nickname'])
+    path_args = [check_python_name(parameter['name'], 'path argument')
+                 for parameter in operation['parameters']
+                 if parameter['paramType'] == 'path']
+    # the special arguments (_fields, _skip, _limit) get their own keyword
+    # arguments; filters go through **params
+    query_args = [parameter['name']
+                  for parameter in operation['parameters']
+                  if parameter['paramType'] == 'query' and
+                  parameter['name'].startswith('_') and
+                  PYTHON_NAME.match(parameter['name'])]
+    has_body = operation['httpMethod'] in ('POST', 'PUT')
+    arguments = ''.join(', %s' % arg for arg in path_args)
+    if has_body:
+        arguments += ', data=None'
+    arguments += ''.join(', %s=None' % arg for arg in query_args)
+    arguments += ', **params'
+    names = (['self'] + path_args + (['data'] if has_body else []) +
+             query_args + ['params'])
+    for arg in set(names):
+        if names.count(arg) > 1:
+            raise ValueError('cannot generate a client: %s() would take '
+                             '%r twice' % (name, arg))
+    params = 'params'
+    if query_args:
+        params = 'dict(params, %s)' % ', '.join(
+            '%s=%s' % (arg, arg) for arg in query_args)
+    doc = [operation.get('summary') or name, '',
+           '%s %s' % (operation['httpMethod'], path)]
+    filters = sorted(parameter['name']
+                     for parameter in operation['parameters']
+                     if parameter['paramType'] == 'query' and
+                     parameter['name'] not in query_args)
+    if filters:
+        doc.extend(['', 'Filters (as keyword arguments): %s' %
+                    ', '.join(filters)])
+    generated = [(name, CLIENT_METHOD % {
+        'name': name,
+        'arguments': arguments,
+        'doc': '\n'.join(('        %s' % line).rstrip() for line in doc),
+        'method': operation['httpMethod'],
+        'path': path,
+        'path_args': ''.join(', %s=%s' % (arg, arg) for arg in path_args),
+        'params': params,
+        'data': ', data' if has_body else ''})]
+    subject = name.split('_', 1)[-1]
+    if operation['nickname'].startswith('list'):
+        generated.append(('iter_%s' % subject, CLIENT_PAGES % {
+            'name': subject, 'method': name}))
+    elif operation['nickname'].startswith('bulkupdate'):
+        generated.append(('batch_%s' % subject, CLIENT_BATCHES % {
+            'name': subject, 'method': name}))
+    return generated
+
+
+def load_swagger(target):
+    """
+    Imports `target` (`module:attribute`) and returns the `Swagger`
+    instance it names: either the `Swagger` itself or the Flask app it's
+    attached to.
+    """
+    module_name, _, attribute = target.partition(':')
+    obj = __import__(module_name, fromlist=['__name__'])
+    for part in (attribute or 'app').split('.'):
+        obj = getattr(obj, part)
+    if not isinstance(obj, Swagger):
+        obj = obj.extensions['swagger']
+    return obj
+
+
+def main(argv=None):
+    """
+    Exports the Swagger documentation for an application to a directory.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__.strip())
+    parser.add_argument('target',
+                        help='module:attribute naming the Swagger instance '
+                        'or the Flask app (default attribute: app)')
+    parser.add_argument('directory', help='where to write the files')
+    parser.add_argument('--base-url', default='http://localhost/',
+                        help='URL the documentation will be served from')
+    parser.add_argument('--compress', action='store_true',
+                        help='also write pre-compressed copies')
+    parser.add_argument('--client', metavar='FILE',
+                        help='also write a Python client module to FILE')
+    args = parser.parse_args(argv)
+    sys.path.insert(0, os.getcwd())
+    swagger = load_swagger(args.target)
+    swagger.export(args.directory, args.base_url, compress=args.compress)
+    if args.client:
+        with open(args.client, 'w') as f:
+            f.write(swagger.generate_client(args.base_url))
+
+
+if __name__ == '__main__':
+    main()
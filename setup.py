@@ -13,6 +13,11 @@ setup(
     long_description=open('README.md').read(),
     py_modules=['flask_mongorest_swagger'],
     platforms='any',
+    entry_points={
+        'console_scripts': [
+            'flask-mongorest-swagger-export = flask_mongorest_swagger:main',
+        ],
+    },
     install_requires=[
         'Flask>=0.7',
         'Flask-MongoRest>=0.1.1',
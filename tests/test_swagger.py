@@ -0,0 +1,316 @@
+"""
+Tests for Flask-MongoRest-Swagger.  Run them with `python -m pytest tests`
+(or `python -m unittest discover tests`).
+
+The generated client is tested against a live server, which needs
+`requests` and `mongomock` (and a MongoEngine recent enough to connect to
+`mongomock://`).
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import unittest
+
+from flask import Flask, request
+from flask.ext.mongorest import MongoRest, methods, operators
+from flask.ext.mongorest.resources import Resource
+from flask.ext.mongorest.views import ResourceView
+from mongoengine import Document, EmbeddedDocument, connect, fields
+from werkzeug.serving import make_server
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+try:
+    import requests
+except ImportError:
+    requests = None
+
+from flask_mongorest_swagger import (Swagger, Endpoint, Operation, dumps,
+                                     generate_client, index_keys, iterdumps)
+
+
+class Address(EmbeddedDocument):
+    street = fields.StringField(help_text='Street')
+    city = fields.StringField(max_length=40, help_text='City')
+
+
+class Widget(Document):
+    name = fields.StringField(max_length=50, help_text='Name')
+    size = fields.IntField(help_text='Size')
+    tags = fields.ListField(fields.StringField(), help_text='Tags')
+    address = fields.EmbeddedDocumentField(Address, help_text='Address')
+    meta = {'indexes': ['name']}
+
+
+class Gadget(Document):
+    title = fields.StringField(help_text='Title')
+    widget = fields.ReferenceField(Widget, help_text='Widget')
+
+
+class Note(Document):
+    body = fields.StringField(help_text='Body')
+    owner = fields.StringField(help_text='Owner')
+    topic = fields.StringField(help_text='Topic')
+    meta = {'indexes': ['$body', '#owner', [('topic', 'hashed')]]}
+
+
+class NoteResource(Resource):
+    document = Note
+    filters = {'body': [operators.Exact],
+               'owner': [operators.Exact, operators.In, operators.Startswith],
+               'topic': [operators.Ne]}
+
+
+class WidgetResource(Resource):
+    document = Widget
+    filters = {'id': [operators.In],
+               'name': [operators.Exact, operators.Startswith],
+               'address': [operators.Exact]}
+
+
+class GadgetResource(Resource):
+    document = Gadget
+    related_resources = {'widget': WidgetResource}
+
+
+class WidgetView(ResourceView):
+    resource = WidgetResource
+    methods = [methods.List, methods.Create, methods.BulkUpdate,
+               methods.Fetch, methods.Update, methods.Delete]
+
+
+class GadgetView(ResourceView):
+    resource = GadgetResource
+    methods = [methods.List, methods.Fetch]
+
+
+def make_app(**kwargs):
+    """
+    Returns `(app, swagger)` with the widget and gadget views registered.
+    """
+    app = Flask(__name__)
+    swagger = Swagger(MongoRest(app), **kwargs)
+    swagger.register(WidgetView, url='/widget/')
+    swagger.register(GadgetView, url='/gadget/')
+    return app, swagger
+
+
+class StreamTestCase(unittest.TestCase):
+    def test_iterdumps_matches_dumps(self):
+        app, swagger = make_app()
+        swagger.build()
+        with app.test_request_context():
+            data = swagger._declaration_data(
+                'json', 'widget', swagger._apis['widget'],
+                swagger._base_path())
+        chunks = list(iterdumps(data, chunk_size=256))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(''.join(chunks), dumps(data))
+
+    def test_streamed_route_matches_buffered_route(self):
+        for name in ('widget', 'gadget'):
+            url = '/api-docs.json/%s' % name
+            buffered = make_app()[0].test_client().get(url)
+            streamed = make_app(stream=True)[0].test_client().get(url)
+            self.assertEqual(buffered.status_code, 200)
+            self.assertEqual(streamed.status_code, 200)
+            self.assertEqual(streamed.data, buffered.data)
+
+    def test_streamed_route_is_streamed(self):
+        app = make_app(stream=True)[0]
+        with app.test_request_context('/api-docs.json/widget'):
+            response = app.full_dispatch_request()
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_streamed)
+            headers = response.get_wsgi_headers(request.environ)
+            self.assertNotIn('Content-Length', headers)
+
+    def test_streamed_route_answers_conditional_requests(self):
+        client = make_app(stream=True)[0].test_client()
+        response = client.get('/api-docs.json/widget')
+        response = client.get('/api-docs.json/widget', headers={
+            'If-Modified-Since': response.headers['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, '')
+
+
+class AggregateTestCase(unittest.TestCase):
+    def test_embedded_documents_are_definitions(self):
+        app = make_app()[0]
+        data = json.loads(app.test_client().get('/swagger.json').data)
+        definitions = data['definitions']
+        widget = definitions['Widget']['properties']
+        self.assertEqual(widget['address']['$ref'], '#/definitions/Address')
+        self.assertEqual(widget['tags']['items'], {'type': 'string'})
+        self.assertEqual(sorted(definitions['Address']['properties']),
+                         ['city', 'street'])
+
+
+class RenderCacheTestCase(unittest.TestCase):
+    def renders(self, swagger, document):
+        return swagger.stats['renders'][document]['count']
+
+    def test_change_only_rerenders_its_declaration(self):
+        app, swagger = make_app()
+        client = app.test_client()
+        urls = ['/api-docs.json', '/api-docs.json/widget',
+                '/api-docs.json/gadget']
+        for url in urls * 2:
+            self.assertEqual(client.get(url).status_code, 200)
+        for document in ('index', 'widget', 'gadget'):
+            self.assertEqual(self.renders(swagger, document), 1)
+
+        swagger.add_api('widget', [Endpoint('/widget/count', 'Count')])
+        for url in urls * 2:
+            self.assertEqual(client.get(url).status_code, 200)
+        self.assertEqual(self.renders(swagger, 'index'), 2)
+        self.assertEqual(self.renders(swagger, 'widget'), 2)
+        self.assertEqual(self.renders(swagger, 'gadget'), 1)
+        self.assertIn('/widget/count',
+                      client.get('/api-docs.json/widget').data)
+
+
+class FingerprintTestCase(unittest.TestCase):
+    def fingerprint(self, seed):
+        here = os.path.dirname(os.path.abspath(__file__))
+        env = dict(os.environ, PYTHONHASHSEED=str(seed),
+                   PYTHONPATH=os.pathsep.join([here, os.path.dirname(here)]))
+        return subprocess.check_output(
+            [sys.executable, '-c',
+             'import test_swagger; '
+             'print(test_swagger.make_app()[1].fingerprint())'],
+            env=env).strip()
+
+    def test_independent_of_hash_seed(self):
+        self.assertEqual(self.fingerprint(1), self.fingerprint(2))
+
+
+class IndexTestCase(unittest.TestCase):
+    def test_text_and_hashed_indexes(self):
+        self.assertNotIn('body', index_keys(Note))
+        self.assertNotIn('owner', index_keys(Note))
+        self.assertEqual(index_keys(Note, hashed=True),
+                         set(['owner', 'topic']))
+        swagger = make_app()[1]
+        table = dict((key, indexed) for (key, _, indexed)
+                     in swagger.filter_table(NoteResource))
+        self.assertEqual(table, {'body': False, 'owner': True,
+                                 'owner__in': True,
+                                 'owner__startswith': False,
+                                 'topic__ne': False})
+
+
+class WarmUpTestCase(unittest.TestCase):
+    def test_ready_once_everything_rendered(self):
+        app, swagger = make_app()
+        progress = []
+        swagger.warm_up(callback=lambda *args: progress.append(args)).join()
+        self.assertTrue(swagger.ready.is_set())
+        self.assertEqual(swagger.warm_up_failures, [])
+        self.assertEqual(progress[-1], (4, 4, []))
+
+    def test_not_ready_after_failures(self):
+        app, swagger = make_app()
+
+        def fail(*args):
+            raise ValueError('broken')
+        swagger._declaration_rendering = fail
+        swagger.warm_up().join()
+        self.assertFalse(swagger.ready.is_set())
+        self.assertEqual(swagger.warm_up_progress, (4, 4))
+        self.assertEqual(
+            sorted(name for _, kind, name, _ in swagger.warm_up_failures),
+            ['gadget', 'widget'])
+
+
+@unittest.skipIf(mongomock is None or requests is None,
+                 'needs mongomock and requests')
+class ClientTestCase(unittest.TestCase):
+    def setUp(self):
+        connect('flask-mongorest-swagger-tests', host='mongomock://localhost')
+        Widget.drop_collection()
+        self.app, self.swagger = make_app()
+        self.server = make_server('127.0.0.1', 0, self.app, threaded=True)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.shutdown)
+
+        base_url = 'http://127.0.0.1:%d/' % self.server.server_port
+        source = self.swagger.generate_client(base_url, 'WidgetClient')
+        namespace = {}
+        exec(compile(source, 'widget_client.py', 'exec'), namespace)
+        self.client = namespace['WidgetClient']()
+
+    def test_list_iter_and_batch(self):
+        ids = [self.client.create_widget(data={'name': 'w%d' % i,
+                                               'size': i})['id']
+               for i in range(5)]
+
+        page = self.client.list_widget(_limit=2)
+        self.assertEqual(len(page['data']), 2)
+        self.assertTrue(page['has_more'])
+        self.assertEqual(
+            [widget['name']
+             for widget in self.client.list_widget(name='w3')['data']],
+            ['w3'])
+
+        widgets = list(self.client.iter_widget(page_size=2))
+        self.assertEqual(sorted(widget['id'] for widget in widgets),
+                         sorted(ids))
+
+        results = self.client.batch_widget({'size': 7}, ids, batch_size=2)
+        self.assertEqual([result['count'] for result in results], [2, 2, 1])
+        self.assertEqual(Widget.objects(size=7).count(), 5)
+        self.assertEqual(self.client.fetch_widget(ids[0])['size'], 7)
+
+
+@unittest.skipIf(mongomock is None, 'needs mongomock')
+class LatencyTestCase(unittest.TestCase):
+    def setUp(self):
+        connect('flask-mongorest-swagger-tests', host='mongomock://localhost')
+
+    def test_apps_time_their_own_requests(self):
+        app1, swagger1 = make_app(track_latency=True)
+        app2, swagger2 = make_app(track_latency=True)
+        self.assertEqual(app1.test_client().get('/widget/').status_code, 200)
+        self.assertEqual(swagger1.latency['listWidget'].count, 1)
+        self.assertNotIn('listWidget', swagger2.latency)
+
+        for _ in range(2):
+            app2.test_client().get('/widget/')
+        self.assertEqual(swagger1.latency['listWidget'].count, 1)
+        self.assertEqual(swagger2.latency['listWidget'].count, 2)
+        self.assertNotIn('get', WidgetView.__dict__)
+
+
+class ClientNamesTestCase(unittest.TestCase):
+    def apis(self, *operations):
+        app = Flask(__name__)
+        swagger = Swagger(MongoRest(app))
+        for i, (path, operation) in enumerate(operations):
+            swagger.add_api('api%d' % i, [Endpoint(path, '', [operation])])
+        return swagger._apis
+
+    def test_invalid_nickname(self):
+        for nickname in ('list-widget', 'class', 'Print'):
+            apis = self.apis(('/widget/', Operation('GET', nickname)))
+            self.assertRaises(ValueError, generate_client, apis, '/')
+
+    def test_invalid_path_argument(self):
+        operation = Operation('GET', 'fetchWidget', parameters={
+            'widget-id': {'paramType': 'path', 'dataType': 'string'}})
+        apis = self.apis(('/widget/{widget-id}/', operation))
+        self.assertRaises(ValueError, generate_client, apis, '/')
+
+    def test_duplicate_nickname(self):
+        apis = self.apis(('/widget/', Operation('GET', 'listWidget')),
+                         ('/widgets/', Operation('GET', 'listWidget')))
+        self.assertRaises(ValueError, generate_client, apis, '/')
+
+
+if __name__ == '__main__':
+    unittest.main()